@@ -0,0 +1,115 @@
+from collections import OrderedDict
+
+from django.apps import apps as global_apps
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.utils import six
+
+from .base import get_composite_fields
+from .operations import AddCompositeSubfields, RemoveCompositeSubfields
+
+
+def get_current_composite_fields(app_label, model_name):
+    """
+    Return the composite fields of the current (not historical) model.
+    Historical models used by the migration framework only know about the
+    concrete subfields.
+    """
+    try:
+        model = global_apps.get_model(app_label, model_name)
+    except LookupError:
+        return []
+    return get_composite_fields(model)
+
+
+class CompositeMigrationAutodetector(MigrationAutodetector):
+    """
+    Autodetector which adds and removes the subfields of a composite field
+    with a single AddCompositeSubfields or RemoveCompositeSubfields
+    operation instead of one AddField or RemoveField per column.
+    """
+
+    def group_by_composite(self, field_keys, match):
+        groups = OrderedDict()
+        for app_label, model_name, field_name in sorted(field_keys):
+            composite_name = None
+            for composite_field in get_current_composite_fields(app_label, model_name):
+                if match(composite_field, field_name):
+                    composite_name = composite_field.name
+                    break
+            key = (app_label, model_name, composite_name or field_name)
+            groups.setdefault(key, []).append(field_name)
+        return groups
+
+    def generate_added_fields(self):
+        def match(composite_field, field_name):
+            return any(
+                composite_field.prefix + name == field_name
+                for name in composite_field)
+        groups = self.group_by_composite(
+            self.new_field_keys - self.old_field_keys, match)
+        for (app_label, model_name, _), field_names in six.iteritems(groups):
+            model = self.new_apps.get_model(app_label, model_name)
+            fields = [model._meta.get_field(name) for name in field_names]
+            if len(fields) == 1 or any(f.is_relation for f in fields):
+                for field_name in field_names:
+                    self._generate_added_field(app_label, model_name, field_name)
+                continue
+            defaults = {}
+            for field in fields:
+                # You can't just add NOT NULL fields with no default or
+                # fields which don't allow empty strings as default.
+                if (not field.null and not field.has_default() and
+                        not (field.blank and field.empty_strings_allowed)):
+                    defaults[field.name] = self.questioner.ask_not_null_addition(
+                        field.name, model_name)
+            self.add_operation(
+                app_label,
+                AddCompositeSubfields(
+                    model_name=model_name,
+                    fields=[(field.name, field) for field in fields],
+                    defaults=defaults,
+                ),
+            )
+
+    def generate_removed_fields(self):
+        def match(composite_field, field_name):
+            # The removed subfields are no longer part of the composite, so
+            # only their name tells whether they belonged to it.
+            prefix = composite_field.prefix
+            return (field_name.startswith(prefix) and
+                    composite_field.is_subfield_name(field_name[len(prefix):]))
+        groups = self.group_by_composite(
+            self.old_field_keys - self.new_field_keys, match)
+        for (app_label, model_name, _), field_names in six.iteritems(groups):
+            model = self.old_apps.get_model(app_label, model_name)
+            fields = [model._meta.get_field(name) for name in field_names]
+            if len(fields) == 1 or any(f.is_relation for f in fields):
+                for field_name in field_names:
+                    self._generate_removed_field(app_label, model_name, field_name)
+                continue
+            dependencies = []
+            for field_name in field_names:
+                dependencies.extend([
+                    (app_label, model_name, field_name, 'order_wrt_unset'),
+                    (app_label, model_name, field_name, 'foo_together_change'),
+                ])
+            self.add_operation(
+                app_label,
+                RemoveCompositeSubfields(
+                    model_name=model_name,
+                    names=field_names,
+                ),
+                dependencies=dependencies,
+            )
+
+    def check_dependency(self, operation, dependency):
+        # Created field
+        if dependency[2] is not None and dependency[3] is True:
+            if isinstance(operation, AddCompositeSubfields):
+                return operation.references_field(dependency[1], dependency[2])
+        # Removed field
+        elif dependency[2] is not None and dependency[3] is False:
+            if isinstance(operation, RemoveCompositeSubfields):
+                return operation.references_field(dependency[1], dependency[2])
+        return super(CompositeMigrationAutodetector, self).check_dependency(
+            operation, dependency)
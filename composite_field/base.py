@@ -1,9 +1,16 @@
 from collections import OrderedDict
 from copy import deepcopy
 
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 from django.db.models.fields import Field
+from django.db.models.lookups import RegisterLookupMixin
 from django.utils import six
 
+from .lookups import (
+    CompositeCol, CompositeGreaterThan, CompositeGreaterThanOrEqual,
+    CompositeIsNull, CompositeLessThan, CompositeLessThanOrEqual, CompositeRange,
+)
+
 
 class CompositeFieldBase(type):
     """Metaclass for all composite fields."""
@@ -29,7 +36,7 @@ class CompositeFieldBase(type):
 
 
 @six.add_metaclass(CompositeFieldBase)
-class CompositeField(object):
+class CompositeField(RegisterLookupMixin):
     is_relation = False
     concrete = False
     column = None
@@ -41,7 +48,10 @@ class CompositeField(object):
     blank = True
     empty_values = []
     primary_key = False
+    null = False
+    empty_strings_allowed = False
     flatchoices = []
+    validators = []
 
     def contribute_to_class(self, cls, name):
         self.name = name
@@ -64,9 +74,11 @@ class CompositeField(object):
         else:
             cls._meta.add_field(self, virtual=True)
 
-    def __init__(self, prefix=None):
+    def __init__(self, prefix=None, validators=None):
         self.prefix = prefix
         self.model = None
+        if validators is not None:
+            self.validators = list(validators)
         self.subfields = deepcopy(self.subfields)
         self.creation_counter = Field.creation_counter
         Field.creation_counter += 1
@@ -108,9 +120,108 @@ class CompositeField(object):
     def set(self, model, value):
         self.get_proxy(model)._set(value)
 
+    def is_subfield_name(self, name):
+        """
+        Return True if ``name`` can be the name of a subfield of this
+        composite field. The migration autodetector uses this to recognize
+        columns of subfields which have been removed from the field.
+        """
+        return True
+
     def clean(self, value, model):
+        """
+        Run the ``validators`` of the composite field on a dict of the
+        cleaned subfield values of ``model``. Errors of the subfields are
+        reported by the subfields themselves, so the validators are skipped
+        if any of them is invalid.
+        """
+        if not self.validators:
+            return value
+        values = {}
+        for name, subfield in six.iteritems(self.subfields):
+            try:
+                values[name] = subfield.clean(
+                    getattr(model, self.prefix + name), model)
+            except ValidationError:
+                return value
+        errors = []
+        for validator in self.validators:
+            try:
+                validator(values)
+            except ValidationError as e:
+                errors.extend(e.error_list)
+        if errors:
+            raise ValidationError(errors)
         return value
 
+    def clean_many(self, values):
+        """
+        Convert and validate many composite values at once without creating
+        model instances.
+
+        Each value can be a tuple or list with one item per subfield, a dict
+        keyed by subfield name or any object exposing the subfield names as
+        attributes. The values are cleaned column by column using the
+        ``to_python``, ``validate`` and ``run_validators`` methods of the
+        subfields. Rows without subfield errors are then passed as a dict of
+        cleaned values to the ``validators`` of the composite field.
+
+        Returns a tuple ``(cleaned, errors)``. ``cleaned`` contains a dict
+        of cleaned values per row or None for invalid rows, ``errors`` maps
+        the index of every invalid row to a ValidationError.
+        """
+        names = list(self.subfields)
+        rows = []
+        errors = {}
+        for index, value in enumerate(values):
+            if isinstance(value, dict):
+                rows.append([value.get(name) for name in names])
+            elif isinstance(value, (list, tuple)):
+                if len(value) != len(names):
+                    errors[index] = {NON_FIELD_ERRORS: [ValidationError(
+                        'Expected %(expected)d values, got %(count)d.',
+                        code='invalid',
+                        params={'expected': len(names), 'count': len(value)},
+                    )]}
+                rows.append((list(value) + [None] * len(names))[:len(names)])
+            else:
+                rows.append([getattr(value, name, None) for name in names])
+        cleaned = [{} for row in rows]
+        for i, (name, subfield) in enumerate(six.iteritems(self.subfields)):
+            to_python = subfield.to_python
+            validate = subfield.validate
+            run_validators = subfield.run_validators
+            for index, row in enumerate(rows):
+                try:
+                    value = to_python(row[i])
+                    validate(value, None)
+                    run_validators(value)
+                except ValidationError as e:
+                    errors.setdefault(index, {})[name] = e.error_list
+                else:
+                    cleaned[index][name] = value
+        if self.validators:
+            for index, row in enumerate(cleaned):
+                if index in errors:
+                    continue
+                for validator in self.validators:
+                    try:
+                        validator(row)
+                    except ValidationError as e:
+                        errors.setdefault(index, {}).setdefault(
+                            NON_FIELD_ERRORS, []).extend(e.error_list)
+        for index in errors:
+            cleaned[index] = None
+            errors[index] = ValidationError(errors[index])
+        return cleaned, errors
+
+    def validate_many(self, values):
+        """
+        Validate many composite values at once and return a dict mapping
+        the index of every invalid row to a ValidationError.
+        """
+        return self.clean_many(values)[1]
+
     def formfield(self, form):
         from django.forms import MultiValueField
         from django import forms
@@ -119,6 +230,9 @@ class CompositeField(object):
     def get_attname_column(self):
         return self.attname, None
 
+    def get_col(self, alias, output_field=None):
+        return CompositeCol(alias, self, output_field)
+
     class Proxy(object):
 
         def __init__(self, composite_field, model):
@@ -148,7 +262,21 @@ class CompositeField(object):
             setattr(self._model, self._subfield_name(name), value)
 
         def __getattr__(self, name):
-            return getattr(self._model, self._subfield_name(name))
+            subfield_name = self._subfield_name(name)
+            if subfield_name not in self._model.__dict__:
+                self._load_deferred()
+            return getattr(self._model, subfield_name)
+
+        def _load_deferred(self):
+            # Load all deferred subfields with a single query instead of
+            # one query per subfield when they are accessed one by one.
+            prefix = self._composite_field.prefix
+            deferred = [
+                prefix + name for name in self._composite_field
+                if prefix + name not in self._model.__dict__
+            ]
+            if deferred and self._model.pk is not None:
+                self._model.refresh_from_db(fields=deferred)
 
         def __eq__(self, other):
             try:
@@ -173,3 +301,23 @@ class CompositeField(object):
                 name: getattr(self, name)
                 for name in self._composite_field
             }
+
+
+CompositeField.register_lookup(CompositeGreaterThan)
+CompositeField.register_lookup(CompositeGreaterThanOrEqual)
+CompositeField.register_lookup(CompositeLessThan)
+CompositeField.register_lookup(CompositeLessThanOrEqual)
+CompositeField.register_lookup(CompositeRange)
+CompositeField.register_lookup(CompositeIsNull)
+
+
+def get_composite_fields(model):
+    """
+    Return the composite fields of ``model``.
+    """
+    opts = model._meta
+    if hasattr(opts, 'private_fields'):
+        virtual_fields = opts.private_fields
+    else:
+        virtual_fields = opts.virtual_fields
+    return [f for f in virtual_fields if isinstance(f, CompositeField)]
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.conf.locale import LANG_INFO
 from django.db.models.fields import CharField, TextField
 from django.utils import six
 from django.utils.encoding import python_2_unicode_compatible
@@ -6,6 +7,9 @@ from django.utils.functional import lazy
 from django.utils.translation import get_language
 
 from .base import CompositeField
+from .lookups import (
+    AllLanguages, AnyLanguage, ConcatLanguages, FallbackLanguage, LocalizedCol,
+)
 
 
 LANGUAGES = map(lambda lang: lang[0], getattr(settings, 'LANGUAGES', ()))
@@ -37,7 +41,26 @@ class LocalizedField(CompositeField):
 
     def get_col(self, alias, output_field=None):
         current_field = self.current_field
-        return current_field.get_col(alias, current_field)
+        return LocalizedCol(alias, current_field, current_field, self)
+
+    def get_fallback_languages(self):
+        """
+        Return the languages in the order used by
+        ``Proxy.current_with_fallback``.
+        """
+        language = get_language() or settings.LANGUAGE_CODE
+        candidates = [language, language.split('-')[0]]
+        candidates.extend(lang[0].split('-')[0] for lang in settings.LANGUAGES)
+        languages = []
+        for language in candidates:
+            if language in self and language not in languages:
+                languages.append(language)
+        return languages
+
+    def is_subfield_name(self, name):
+        return (
+            name in self or name in LANG_INFO or
+            any(name == lang[0] for lang in settings.LANGUAGES))
 
     @property
     def current_field(self):
@@ -95,6 +118,12 @@ class LocalizedField(CompositeField):
             return ''
 
 
+LocalizedField.register_lookup(AnyLanguage)
+LocalizedField.register_lookup(AllLanguages)
+LocalizedField.register_lookup(FallbackLanguage)
+LocalizedField.register_lookup(ConcatLanguages)
+
+
 class LocalizedCharField(LocalizedField):
 
     def __init__(self, *args, **kwargs):
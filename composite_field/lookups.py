@@ -0,0 +1,327 @@
+from functools import partial
+
+from django.core.exceptions import FieldError
+from django.db.models.expressions import Col, Expression, Func, Value
+from django.db.models.functions import Coalesce, Concat
+from django.db.models.lookups import Lookup
+from django.db.models.sql.where import AND, OR, WhereNode
+from django.utils import six
+
+
+def supports_row_values(connection):
+    """
+    Return True if the database understands row value comparisons such
+    as ``(a, b) > (1, 2)``.
+    """
+    if connection.vendor == 'sqlite':
+        # Row values were added in SQLite 3.15.0
+        return connection.Database.sqlite_version_info >= (3, 15, 0)
+    return connection.vendor in ('postgresql', 'mysql')
+
+
+class CompositeCol(Expression):
+    """
+    Expression referencing all columns of a composite field. It is the
+    left hand side of the composite lookups and renders as a row value.
+    """
+    contains_column_references = True
+
+    def __init__(self, alias, target, output_field=None):
+        if output_field is None:
+            output_field = target
+        super(CompositeCol, self).__init__(output_field=output_field)
+        self.alias, self.target = alias, target
+        self.cols = [
+            subfield.get_col(alias)
+            for subfield in six.itervalues(target.subfields)
+        ]
+
+    def __repr__(self):
+        return '%s(%s, %s)' % (
+            self.__class__.__name__, self.alias, self.target.name)
+
+    def get_source_expressions(self):
+        return self.cols
+
+    def set_source_expressions(self, exprs):
+        self.cols = exprs
+
+    def as_sql(self, compiler, connection):
+        sqls, params = [], []
+        for sql, col_params in self.compile_cols(compiler):
+            sqls.append(sql)
+            params.extend(col_params)
+        return '(%s)' % ', '.join(sqls), params
+
+    def compile_cols(self, compiler):
+        return [compiler.compile(col) for col in self.cols]
+
+    def relabeled_clone(self, relabels):
+        return self.__class__(
+            relabels.get(self.alias, self.alias), self.target,
+            self.output_field)
+
+    def get_group_by_cols(self):
+        return list(self.cols)
+
+
+class CompositeComparison(Lookup):
+    """
+    Compare a composite field against a composite value using a row
+    value comparison like ``(coord_x, coord_y) > (%s, %s)``.
+
+    The value can be a tuple or list with one item per subfield, a dict
+    keyed by subfield name or any object exposing the subfield names as
+    attributes (e.g. the proxy of another model instance).
+    """
+    operator = None
+
+    def get_prep_lookup(self):
+        return self.prepare_value(self.rhs)
+
+    def prepare_value(self, value):
+        composite_field = self.lhs.output_field
+        if hasattr(value, 'resolve_expression'):
+            raise FieldError(
+                '%r lookup on %s does not support expressions, got %r' % (
+                    self.lookup_name, composite_field.name, value))
+        if isinstance(value, dict):
+            values = [value[name] for name in composite_field]
+        elif isinstance(value, (list, tuple)):
+            values = list(value)
+            if len(values) != len(composite_field.subfields):
+                raise ValueError(
+                    '%r lookup on %s expects %d values, got %d' % (
+                        self.lookup_name, composite_field.name,
+                        len(composite_field.subfields), len(values)))
+        else:
+            values = [getattr(value, name) for name in composite_field]
+        return [
+            subfield.get_prep_value(v) for subfield, v in
+            zip(six.itervalues(composite_field.subfields), values)
+        ]
+
+    def process_values(self, values, connection):
+        composite_field = self.lhs.output_field
+        return [
+            subfield.get_db_prep_value(v, connection, prepared=True)
+            for subfield, v in
+            zip(six.itervalues(composite_field.subfields), values)
+        ]
+
+    def compare(self, compiler, connection, operator, values):
+        values = self.process_values(values, connection)
+        if supports_row_values(connection):
+            lhs_sql, params = compiler.compile(self.lhs)
+            sql = '%s %s (%s)' % (
+                lhs_sql, operator, ', '.join(['%s'] * len(values)))
+            return sql, params + values
+        cols = self.lhs.compile_cols(compiler)
+        # Expand the row comparison into its lexicographic equivalent:
+        # (a, b, c) > (1, 2, 3) becomes
+        # a > 1 OR (a = 1 AND b > 2) OR (a = 1 AND b = 2 AND c > 3)
+        strict_operator = operator[0]
+        terms, params = [], []
+        for i, (sql, col_params) in enumerate(cols):
+            parts = []
+            for (eq_sql, eq_params), value in zip(cols[:i], values):
+                parts.append('%s = %%s' % eq_sql)
+                params.extend(eq_params + [value])
+            last = i == len(cols) - 1
+            parts.append('%s %s %%s' % (
+                sql, operator if last else strict_operator))
+            params.extend(col_params + [values[i]])
+            terms.append('(%s)' % ' AND '.join(parts))
+        return '(%s)' % ' OR '.join(terms), params
+
+    def as_sql(self, compiler, connection):
+        return self.compare(compiler, connection, self.operator, self.rhs)
+
+
+class CompositeGreaterThan(CompositeComparison):
+    lookup_name = 'gt'
+    operator = '>'
+
+
+class CompositeGreaterThanOrEqual(CompositeComparison):
+    lookup_name = 'gte'
+    operator = '>='
+
+
+class CompositeLessThan(CompositeComparison):
+    lookup_name = 'lt'
+    operator = '<'
+
+
+class CompositeLessThanOrEqual(CompositeComparison):
+    lookup_name = 'lte'
+    operator = '<='
+
+
+class CompositeRange(CompositeComparison):
+    lookup_name = 'range'
+
+    def get_prep_lookup(self):
+        start, end = self.rhs
+        return self.prepare_value(start), self.prepare_value(end)
+
+    def as_sql(self, compiler, connection):
+        start, end = self.rhs
+        start_sql, start_params = self.compare(compiler, connection, '>=', start)
+        end_sql, end_params = self.compare(compiler, connection, '<=', end)
+        return '%s AND %s' % (start_sql, end_sql), start_params + end_params
+
+
+class CompositeIsNull(Lookup):
+    """
+    A composite value is null if all of its subfields are null.
+    ``isnull=False`` is the exact opposite, i.e. at least one subfield is
+    not null.
+    """
+    lookup_name = 'isnull'
+
+    def get_prep_lookup(self):
+        return self.rhs
+
+    def as_sql(self, compiler, connection):
+        sqls, params = [], []
+        for sql, col_params in self.lhs.compile_cols(compiler):
+            sqls.append('%s IS NULL' % sql)
+            params.extend(col_params)
+        sql = '(%s)' % ' AND '.join(sqls)
+        if not self.rhs:
+            sql = 'NOT %s' % sql
+        return sql, params
+
+
+class LocalizedCol(Col):
+    """
+    Column of the current language of a LocalizedField. Besides the lookups
+    of the language field it supports the language transforms registered
+    on the LocalizedField (``name__any__icontains``).
+    """
+
+    def __init__(self, alias, target, output_field=None, localized_field=None):
+        super(LocalizedCol, self).__init__(alias, target, output_field)
+        self.localized_field = localized_field
+
+    def relabeled_clone(self, relabels):
+        return self.__class__(
+            relabels.get(self.alias, self.alias), self.target,
+            self.output_field, self.localized_field)
+
+    def compile_cols(self, compiler):
+        # CompositeIsNull checks the columns of all languages
+        return [
+            compiler.compile(subfield.get_col(self.alias))
+            for subfield in six.itervalues(self.localized_field.subfields)
+        ]
+
+    def get_transform(self, name):
+        found = self.localized_field._get_lookup(name)
+        if found is not None and issubclass(found, LanguageTransform):
+            return found
+        return super(LocalizedCol, self).get_transform(name)
+
+
+class LanguageTransform(object):
+    """
+    Abstract base class for transforms spanning all language columns of a
+    LocalizedField. The lookup following the transform is compiled into
+    a single condition over the language columns by the
+    ``build_lookup(lookup_class, lhs, rhs)`` method of the subclasses.
+    """
+    lookup_name = None
+
+    def __init__(self, lhs, lookups=None):
+        # Django 1.8 passes the remaining lookups as well
+        self.lhs = lhs
+        self.localized_field = lhs.localized_field
+        self.output_field = lhs.output_field
+
+    def get_col(self, language):
+        return self.localized_field[language].get_col(self.lhs.alias)
+
+    def get_lookup(self, lookup_name):
+        lookup_class = self.output_field.get_lookup(lookup_name)
+        if lookup_class is None:
+            return None
+        return partial(self.build_lookup, lookup_class)
+
+    def get_transform(self, lookup_name):
+        return None
+
+
+class CombinedLanguageTransform(LanguageTransform):
+    """
+    Apply the lookup to every language column and combine the conditions
+    with ``connector``. The condition of a nullable column is false instead
+    of NULL for missing translations so that ``exclude()`` keeps rows
+    which have no translation in some language.
+    """
+    connector = None
+
+    def build_lookup(self, lookup_class, lhs, rhs):
+        condition = WhereNode(connector=self.connector)
+        for language in self.localized_field:
+            col = self.get_col(language)
+            lookup = lookup_class(col, rhs)
+            if (self.localized_field[language].null and
+                    lookup_class.lookup_name != 'isnull'):
+                is_null = col.output_field.get_lookup('isnull')
+                lookup = WhereNode([is_null(col, False), lookup])
+            condition.add(lookup, self.connector)
+        condition.lookup_name = lookup_class.lookup_name
+        return condition
+
+
+class AnyLanguage(CombinedLanguageTransform):
+    lookup_name = 'any'
+    connector = OR
+
+
+class AllLanguages(CombinedLanguageTransform):
+    lookup_name = 'all'
+    connector = AND
+
+
+class NullIfEmpty(Func):
+    function = 'NULLIF'
+    template = "%(function)s(%(expressions)s, '')"
+
+
+class FallbackLanguage(LanguageTransform):
+    """
+    Apply the lookup to the first non empty translation in the order used
+    by ``LocalizedField.Proxy.current_with_fallback``.
+    """
+    lookup_name = 'fallback'
+
+    def build_lookup(self, lookup_class, lhs, rhs):
+        expressions = [
+            NullIfEmpty(self.get_col(language))
+            for language in self.localized_field.get_fallback_languages()
+        ]
+        expressions.append(Value(''))
+        return lookup_class(
+            Coalesce(*expressions, output_field=self.output_field), rhs)
+
+
+class ConcatLanguages(LanguageTransform):
+    """
+    Apply the lookup once to all translations joined by a space. Unlike
+    ``any`` a search term like ``'bier beer'`` can span two translations.
+    """
+    lookup_name = 'concat'
+    separator = ' '
+
+    def build_lookup(self, lookup_class, lhs, rhs):
+        expressions = []
+        for language in self.localized_field:
+            if expressions:
+                expressions.append(Value(self.separator))
+            expressions.append(self.get_col(language))
+        if len(expressions) == 1:
+            return lookup_class(expressions[0], rhs)
+        return lookup_class(
+            Concat(*expressions, output_field=self.output_field), rhs)
@@ -0,0 +1,504 @@
+import csv
+import io
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from functools import partial
+from itertools import islice
+
+from django.apps import apps
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import AutoField, Case, F, Field, Value, When
+from django.utils import six
+
+from composite_field.base import get_composite_fields
+from composite_field.query import expand_composite_names
+
+
+def get_model_label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.object_name)
+
+
+def build_column_map(model, columns, nested=False):
+    """
+    Map input columns to attnames of ``model``. A column can be named after
+    a concrete field (``name``, ``coord_x``) or after a subfield of a
+    composite field (``coord.x``, ``name.de``). If ``nested`` is true a
+    column can also be named after a composite field and contain a list
+    with one value per subfield.
+
+    The columns have to cover either all or none of the subfields of a
+    composite field and all required fields, i.e. fields which are not
+    nullable and have no default, so that no row would fail on insert.
+    """
+    attnames = {}
+    for field in model._meta.concrete_fields:
+        attnames[field.name] = field.attname
+        attnames[field.attname] = field.attname
+    composite_fields = get_composite_fields(model)
+    for composite_field in composite_fields:
+        if nested:
+            attnames[composite_field.name] = composite_field.name
+        for name in composite_field:
+            attnames['%s.%s' % (composite_field.name, name)] = \
+                composite_field.prefix + name
+    column_map = {}
+    for column in columns:
+        if column not in attnames:
+            raise CommandError('Unknown column %r for model %s' % (
+                column, get_model_label(model)))
+        column_map[column] = attnames[column]
+    mapped = set(six.itervalues(column_map))
+    for composite_field in composite_fields:
+        subfield_attnames = [
+            composite_field.prefix + name for name in composite_field]
+        if composite_field.name in mapped:
+            mapped.update(subfield_attnames)
+            continue
+        missing = [a for a in subfield_attnames if a not in mapped]
+        if missing and len(missing) < len(subfield_attnames):
+            raise CommandError(
+                'Missing columns %s of composite field %r of model %s' % (
+                    ', '.join(missing), composite_field.name,
+                    get_model_label(model)))
+    for field in model._meta.concrete_fields:
+        if (field.attname not in mapped and not field.null and
+                not field.has_default() and
+                not field.empty_strings_allowed and
+                not isinstance(field, AutoField)):
+            raise CommandError(
+                'Missing column for required field %r of model %s' % (
+                    field.name, get_model_label(model)))
+    return column_map
+
+
+def read_csv_rows(f, delimiter):
+    """
+    Read the rows of the CSV text stream ``f`` as lists of text strings.
+    """
+    if six.PY2:
+        # The csv module of Python 2 only handles byte strings, so the
+        # lines are encoded to UTF-8 for the parser and every cell is
+        # decoded again.
+        reader = csv.reader(
+            (line.encode('utf-8') for line in f),
+            delimiter=delimiter.encode('utf-8'))
+        for row in reader:
+            yield [cell.decode('utf-8') for cell in row]
+    else:
+        for row in csv.reader(f, delimiter=delimiter):
+            yield row
+
+
+def flatten_record(record, composite_fields):
+    """
+    Flatten nested composite values of a JSON record:
+    ``{"coord": {"x": 1, "y": 2}}`` becomes ``{"coord.x": 1, "coord.y": 2}``.
+    Lists like ``{"coord": [1, 2]}`` are kept as they are, so that
+    ``convert_rows`` can report a wrong number of values as an invalid row.
+    """
+    flat = {}
+    for key, value in six.iteritems(record):
+        composite_field = composite_fields.get(key)
+        if composite_field is not None and isinstance(value, dict):
+            for name, subvalue in six.iteritems(value):
+                flat['%s.%s' % (key, name)] = subvalue
+        else:
+            flat[key] = value
+    return flat
+
+
+def clean_relation(field, value, model_instance):
+    """
+    Like ``ForeignKey.clean`` but without the query checking that the
+    related object exists, which ``Command.check_relations`` does once per
+    chunk instead of once per row.
+    """
+    # ForeignKey.to_python doesn't convert the value on all Django versions
+    value = field.related_fields[0][1].to_python(value)
+    Field.validate(field, value, model_instance)
+    field.run_validators(value)
+    return value
+
+
+def convert_rows(task):
+    """
+    Convert and validate a chunk of raw rows in a worker process.
+
+    ``task`` is a tuple ``(model_label, first_row, rows)`` where every row
+    maps attnames to raw values. Composite fields are cleaned with
+    ``CompositeField.clean_many``, either from their subfield values or from
+    a list stored under the name of the composite field, foreign keys with
+    ``clean_relation`` and everything else with ``Field.clean``. Returns the list of ``(row_number, values)`` tuples
+    of the valid rows and the list of ``(row_number, message_dict)`` tuples
+    of the invalid ones, numbered from ``first_row``.
+    """
+    model_label, first_row, rows = task
+    model = apps.get_model(model_label)
+    present = set()
+    for row in rows:
+        present.update(row)
+    fields = dict(
+        (field.attname, field) for field in model._meta.concrete_fields
+        if field.attname in present)
+    for row in rows:
+        for attname, value in list(six.iteritems(row)):
+            # CSV has no NULL, so treat empty values of non-string fields
+            # as missing values.
+            if (value == '' and attname in fields and
+                    not fields[attname].empty_strings_allowed):
+                row[attname] = None
+    errors = {}
+    for index, row in enumerate(rows):
+        # Lines which couldn't be parsed by the command
+        if NON_FIELD_ERRORS in row:
+            errors[index] = {NON_FIELD_ERRORS: row.pop(NON_FIELD_ERRORS)}
+    cleaned = [{} for row in rows]
+    for composite_field in get_composite_fields(model):
+        prefix = composite_field.prefix
+        attnames = [prefix + name for name in composite_field]
+        indexes, values = [], []
+        for index, row in enumerate(rows):
+            if composite_field.name in row:
+                values.append(row.pop(composite_field.name))
+            elif any(attname in row for attname in attnames):
+                values.append(dict(
+                    (name, row.get(prefix + name)) for name in composite_field))
+            else:
+                continue
+            indexes.append(index)
+        composite_cleaned, composite_errors = composite_field.clean_many(values)
+        for i, error in six.iteritems(composite_errors):
+            errors.setdefault(indexes[i], {}).update(
+                (composite_field.name if key == NON_FIELD_ERRORS else
+                 prefix + key, messages)
+                for key, messages in six.iteritems(error.message_dict))
+        for index, row_values in zip(indexes, composite_cleaned):
+            if row_values is not None:
+                cleaned[index].update(
+                    (prefix + name, value)
+                    for name, value in six.iteritems(row_values))
+        for attname in attnames:
+            fields.pop(attname, None)
+    for attname, field in six.iteritems(fields):
+        if field.is_relation:
+            clean = partial(clean_relation, field)
+        else:
+            clean = field.clean
+        for index, row in enumerate(rows):
+            if attname not in row:
+                continue
+            try:
+                cleaned[index][attname] = clean(row[attname], None)
+            except ValidationError as e:
+                errors.setdefault(index, {})[attname] = e.messages
+    valid = [
+        (first_row + index, values) for index, values in enumerate(cleaned)
+        if index not in errors
+    ]
+    invalid = [
+        (first_row + index, errors[index]) for index in sorted(errors)
+    ]
+    return valid, invalid
+
+
+def imap_bounded(pool, func, tasks, window):
+    """
+    Like ``Pool.imap`` but only keeps ``window`` tasks in flight so that
+    the input is not read into memory faster than it can be written.
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def init_worker():
+    # Worker processes which are spawned instead of forked need to set up
+    # Django themselves.
+    if not apps.ready:
+        import django
+        django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a CSV or JSON lines file into a model with composite fields. "
+        "Columns can refer to subfields as 'coord.x' or 'coord_x'; JSON "
+        "records may also contain nested objects like {\"coord\": {\"x\": 1}}.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='Model label, e.g. app_label.Model')
+        parser.add_argument('path', help='Path of the CSV or JSON lines file')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+            help='Input format. Defaults to the file extension.')
+        parser.add_argument('--delimiter', default=',',
+            help='Field delimiter of CSV files.')
+        parser.add_argument('--encoding', default='utf-8',
+            help='Encoding of the input file.')
+        parser.add_argument('--workers', type=int,
+            default=multiprocessing.cpu_count(),
+            help='Number of processes used for converting rows. '
+                 'Use 1 to convert rows in the main process.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+            help='Number of rows converted and written per transaction.')
+        parser.add_argument('--batch-size', type=int, default=None,
+            help='Batch size passed to bulk_create().')
+        parser.add_argument('--upsert-on',
+            help='Comma separated fields or composite fields identifying '
+                 'existing rows which are updated instead of created.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+            help='Database to import into.')
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+        self.model = model
+        self.database = options['database']
+        self.batch_size = options['batch_size']
+        self.key_attnames = None
+        if options['upsert_on']:
+            self.key_attnames = expand_composite_names(
+                model, options['upsert_on'].split(','))
+            concrete = set(f.attname for f in model._meta.concrete_fields)
+            for attname in self.key_attnames:
+                if attname not in concrete:
+                    raise CommandError('Unknown upsert field %r' % attname)
+        input_format = options['format']
+        if input_format is None:
+            extension = os.path.splitext(options['path'])[1].lower()
+            input_format = 'csv' if extension == '.csv' else 'jsonl'
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+
+        start = time.time()
+        imported = invalid_count = 0
+        with io.open(options['path'], encoding=options['encoding'],
+                     newline='') as f:
+            if input_format == 'csv':
+                rows = self.read_csv(f, options['delimiter'])
+            else:
+                rows = self.read_jsonl(f)
+            tasks = self.chunks(rows, chunk_size)
+            if workers > 1:
+                pool = multiprocessing.Pool(workers, initializer=init_worker)
+                results = imap_bounded(pool, convert_rows, tasks, workers * 2)
+            else:
+                pool = None
+                results = six.moves.map(convert_rows, tasks)
+            try:
+                for valid, invalid in results:
+                    missing = self.check_relations(valid)
+                    if self.key_attnames is not None:
+                        for row_number, messages in six.iteritems(
+                                self.check_keys(valid)):
+                            missing.setdefault(row_number, {}).update(messages)
+                    if missing:
+                        valid = [
+                            (row_number, values) for row_number, values in valid
+                            if row_number not in missing]
+                        invalid = sorted(invalid + list(missing.items()))
+                    for row_number, messages in invalid:
+                        self.stderr.write('Row %d: %s' % (row_number, '; '.join(
+                            ' '.join(value) if key == NON_FIELD_ERRORS else
+                            '%s: %s' % (key, ' '.join(value))
+                            for key, value in sorted(messages.items()))))
+                    imported += self.write(
+                        [values for row_number, values in valid])
+                    invalid_count += len(invalid)
+                    if options['verbosity'] >= 2:
+                        self.stdout.write('%d rows imported' % imported)
+            finally:
+                if pool is not None:
+                    pool.terminate()
+        elapsed = time.time() - start
+        self.stdout.write(
+            'Imported %d rows (%d invalid) in %.2fs (%.0f rows/s)' % (
+                imported, invalid_count, elapsed,
+                imported / elapsed if elapsed else 0))
+
+    def read_csv(self, f, delimiter):
+        reader = read_csv_rows(f, delimiter)
+        columns = next(reader, [])
+        column_map = build_column_map(self.model, columns)
+        attnames = [column_map[column] for column in columns]
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != len(attnames):
+                yield {NON_FIELD_ERRORS: [
+                    'Expected %d cells, got %d.' % (len(attnames), len(row))]}
+                continue
+            yield dict(zip(attnames, row))
+
+    def read_jsonl(self, f):
+        composite_fields = dict(
+            (field.name, field) for field in get_composite_fields(self.model))
+        column_maps = {}
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield {NON_FIELD_ERRORS: ['Invalid JSON: %s' % e]}
+                continue
+            if not isinstance(record, dict):
+                yield {NON_FIELD_ERRORS: ['Expected a JSON object.']}
+                continue
+            record = flatten_record(record, composite_fields)
+            columns = tuple(sorted(record))
+            if columns not in column_maps:
+                column_maps[columns] = build_column_map(
+                    self.model, columns, nested=True)
+            column_map = column_maps[columns]
+            yield dict(
+                (column_map[column], value)
+                for column, value in six.iteritems(record))
+
+    def chunks(self, rows, chunk_size):
+        # Rows are numbered from 1 in the order of the input, not counting
+        # the CSV header.
+        row_number = 1
+        model_label = get_model_label(self.model)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            yield model_label, row_number, chunk
+            row_number += len(chunk)
+
+    def check_relations(self, rows):
+        """
+        Check that the objects referenced by the foreign keys of the
+        ``(row_number, values)`` tuples in ``rows`` exist, using one query per
+        foreign key and 500 distinct values. Returns a dict mapping the numbers of the rows
+        referencing missing objects to their error messages.
+        """
+        missing = {}
+        for field in self.model._meta.concrete_fields:
+            if not field.is_relation:
+                continue
+            values = set(
+                row_values[field.attname] for row_number, row_values in rows
+                if row_values.get(field.attname) is not None)
+            if not values:
+                continue
+            target_field = field.related_fields[0][1]
+            manager = field.related_model._default_manager.using(self.database)
+            existing = set()
+            values = list(values)
+            # Keep the number of query parameters below the SQLite limit
+            for i in range(0, len(values), 500):
+                existing.update(manager.filter(**{
+                    '%s__in' % target_field.name: values[i:i + 500],
+                }).values_list(target_field.name, flat=True))
+            for row_number, row_values in rows:
+                value = row_values.get(field.attname)
+                if value is None or value in existing:
+                    continue
+                error = ValidationError(
+                    field.error_messages['invalid'], code='invalid',
+                    params={
+                        'model': field.related_model._meta.verbose_name,
+                        'pk': value, 'field': target_field.name,
+                        'value': value,
+                    })
+                missing.setdefault(row_number, {})[field.attname] = \
+                    error.messages
+        return missing
+
+    def check_keys(self, rows):
+        """
+        Return a dict mapping the numbers of the rows in ``rows`` whose
+        upsert key has a missing or NULL value to their error messages.
+        NULL never matches an existing row, so these rows would always be
+        inserted.
+        """
+        invalid = {}
+        for row_number, values in rows:
+            for attname in self.key_attnames:
+                if values.get(attname) is None:
+                    invalid.setdefault(row_number, {})[attname] = [
+                        'Upsert key fields must not be empty.']
+        return invalid
+
+    def write(self, rows):
+        """
+        Write the rows of a chunk and return the number of rows written.
+        """
+        manager = self.model._default_manager.db_manager(self.database)
+        with transaction.atomic(using=self.database):
+            if self.key_attnames is None:
+                manager.bulk_create(
+                    [self.model(**values) for values in rows],
+                    batch_size=self.batch_size)
+                return len(rows)
+            return self.upsert(manager, rows)
+
+    def upsert(self, manager, rows):
+        key_attnames = self.key_attnames
+        new = {}
+        for values in rows:
+            new[tuple(values.get(a) for a in key_attnames)] = values
+        # Only the last row of every key is written
+        written = len(new)
+        existing = {}
+        keys = list(new)
+        # Keep the number of query parameters below the SQLite limit
+        step = max(1, 500 // len(key_attnames))
+        for i in range(0, len(keys), step):
+            batch = keys[i:i + step]
+            lookup = dict(
+                ('%s__in' % attname, set(key[j] for key in batch))
+                for j, attname in enumerate(key_attnames))
+            for obj in manager.filter(**lookup).values('pk', *key_attnames):
+                existing[tuple(obj[a] for a in key_attnames)] = obj['pk']
+        self.update(manager, [
+            (pk, new.pop(key)) for key, pk in six.iteritems(existing)
+            if key in new
+        ])
+        manager.bulk_create(
+            [self.model(**values) for values in six.itervalues(new)],
+            batch_size=self.batch_size)
+        return written
+
+    def update(self, manager, updates):
+        """
+        Apply the ``(pk, values)`` tuples in ``updates`` with a single UPDATE
+        setting every column to a CASE expression over the primary keys.
+        The rows are only split into several UPDATE statements to stay below
+        the query parameter limit of the database.
+        """
+        if not updates:
+            return
+        fields = [
+            field for field in self.model._meta.concrete_fields
+            if not field.primary_key and
+            field.attname not in self.key_attnames and
+            any(field.attname in values for pk, values in updates)
+        ]
+        if not fields:
+            return
+        # Every column needs a parameter for the primary key and the value
+        # of each row, the WHERE clause one for the primary key.
+        batch_size = connections[self.database].ops.bulk_batch_size(
+            ['pk'] + fields * 2, updates)
+        for i in range(0, len(updates), batch_size):
+            batch = updates[i:i + batch_size]
+            manager.filter(pk__in=[pk for pk, values in batch]).update(**dict(
+                (field.attname, Case(
+                    *[When(pk=pk, then=Value(values[field.attname],
+                                             output_field=field))
+                      for pk, values in batch if field.attname in values],
+                    default=F(field.attname), output_field=field))
+                for field in fields))
@@ -0,0 +1,19 @@
+from django.core.management.commands import makemigrations
+
+from composite_field.autodetector import CompositeMigrationAutodetector
+
+
+class Command(makemigrations.Command):
+    help = makemigrations.Command.help + (
+        " Subfields added to or removed from a composite field are"
+        " combined into a single operation.")
+
+    def handle(self, *app_labels, **options):
+        # The stock command instantiates the autodetector by its module
+        # level name, so swap it for the duration of the command.
+        autodetector = makemigrations.MigrationAutodetector
+        makemigrations.MigrationAutodetector = CompositeMigrationAutodetector
+        try:
+            return super(Command, self).handle(*app_labels, **options)
+        finally:
+            makemigrations.MigrationAutodetector = autodetector
@@ -0,0 +1,315 @@
+from copy import copy
+
+from django.db.migrations.operations.base import Operation
+from django.db.models import NOT_PROVIDED
+from django.utils.functional import cached_property
+
+
+# Backends which accept several comma separated ADD COLUMN, DROP COLUMN and
+# ALTER COLUMN clauses in a single ALTER TABLE statement.
+BATCH_ALTER_VENDORS = ('postgresql', 'mysql')
+
+
+def _alter_table_clause(template, table, **kwargs):
+    # Turn a single column "ALTER TABLE ..." template of the schema editor
+    # into the clause following the table name so that several of them can
+    # be joined into one statement.
+    sql = template % dict(kwargs, table=table)
+    prefix = 'ALTER TABLE %s ' % table
+    if not sql.startswith(prefix):
+        raise ValueError('Unexpected ALTER TABLE template %r' % template)
+    return sql[len(prefix):]
+
+
+def _batch_method(connection, fields):
+    # Relational fields need constraints which are only handled by the
+    # schema editor itself.
+    if any(field.is_relation for field in fields):
+        return None
+    if connection.vendor == 'sqlite':
+        return 'remake'
+    if connection.vendor in BATCH_ALTER_VENDORS:
+        return 'alter'
+    return None
+
+
+def add_fields(schema_editor, model, fields):
+    """
+    Add the columns of ``fields`` to the table of ``model``.
+
+    On PostgreSQL all columns are added as nullable columns with a single
+    ALTER TABLE, the defaults are written with a single UPDATE and NOT NULL
+    is set with another ALTER TABLE. MySQL rebuilds the table to change
+    the nullability of a column, so there all columns are added with their
+    default and NOT NULL in a single ALTER TABLE and the defaults are
+    dropped again with another one. SQLite rebuilds the table once for all
+    fields. Other backends and relational fields fall back to adding the
+    fields one by one.
+    """
+    connection = schema_editor.connection
+    method = _batch_method(connection, fields)
+    if method == 'remake':
+        schema_editor._remake_table(model, create_fields=fields)
+        return
+    if method is None:
+        for field in fields:
+            schema_editor.add_field(model, field)
+        return
+    if connection.vendor == 'postgresql':
+        _add_nullable_columns(schema_editor, model, fields)
+    else:
+        _add_columns_with_defaults(schema_editor, model, fields)
+    for field in fields:
+        if field.db_index and not field.unique:
+            schema_editor.deferred_sql.append(
+                schema_editor._create_index_sql(model, [field]))
+        # PostgreSQL needs an extra index for LIKE queries on varchar and
+        # text columns, see DatabaseSchemaEditor.add_field of that backend.
+        if hasattr(schema_editor, '_create_like_index_sql'):
+            like_index_statement = schema_editor._create_like_index_sql(
+                model, field)
+            if like_index_statement is not None:
+                schema_editor.deferred_sql.append(like_index_statement)
+    if connection.features.connection_persists_old_columns:
+        connection.close()
+
+
+def _add_columns(schema_editor, model, fields, include_default):
+    qn = schema_editor.quote_name
+    table = qn(model._meta.db_table)
+    clauses, params = [], []
+    for field in fields:
+        definition, definition_params = schema_editor.column_sql(
+            model, field, include_default=include_default)
+        db_params = field.db_parameters(connection=schema_editor.connection)
+        if db_params['check']:
+            definition += ' CHECK (%s)' % db_params['check']
+        clauses.append(_alter_table_clause(
+            schema_editor.sql_create_column, table,
+            column=qn(field.column), definition=definition))
+        params.extend(definition_params)
+    schema_editor.execute(
+        'ALTER TABLE %s %s' % (table, ', '.join(clauses)), params)
+
+
+def _backfill(schema_editor, model, fields):
+    # Write the defaults of all columns in a single pass
+    qn = schema_editor.quote_name
+    assignments, params = [], []
+    for field in fields:
+        default = schema_editor.effective_default(field)
+        if default is not None:
+            assignments.append('%s = %%s' % qn(field.column))
+            params.append(default)
+    if assignments:
+        schema_editor.execute('UPDATE %s SET %s' % (
+            qn(model._meta.db_table), ', '.join(assignments)), params)
+
+
+def _add_nullable_columns(schema_editor, model, fields):
+    qn = schema_editor.quote_name
+    # 1. Add all columns as nullable columns without a default. This does
+    #    not need to touch the existing rows.
+    nullable_fields = []
+    for field in fields:
+        nullable_field = copy(field)
+        nullable_field.null = True
+        nullable_fields.append(nullable_field)
+    _add_columns(schema_editor, model, nullable_fields, include_default=False)
+    # 2. Backfill the defaults of all columns in a single pass
+    _backfill(schema_editor, model, fields)
+    # 3. Make the columns NOT NULL
+    changes = [
+        schema_editor.sql_alter_column_not_null % {
+            'column': qn(field.column),
+            'type': field.db_type(schema_editor.connection),
+        }
+        for field in fields if not field.null
+    ]
+    if changes:
+        schema_editor.execute(schema_editor.sql_alter_column % {
+            'table': qn(model._meta.db_table),
+            'changes': ', '.join(changes),
+        })
+
+
+def _add_columns_with_defaults(schema_editor, model, fields):
+    qn = schema_editor.quote_name
+    # 1. Add all columns with their final nullability, using the default
+    #    to fill the existing rows.
+    _add_columns(schema_editor, model, fields, include_default=True)
+    # 2. Drop the database defaults again like BaseDatabaseSchemaEditor
+    #    does, Django doesn't use them.
+    changes = [
+        schema_editor.sql_alter_column_no_default % {'column': qn(field.column)}
+        for field in fields if not schema_editor.skip_default(field)
+    ]
+    if changes:
+        schema_editor.execute(schema_editor.sql_alter_column % {
+            'table': qn(model._meta.db_table),
+            'changes': ', '.join(changes),
+        })
+    # 3. Columns which can't have a default (TEXT and BLOB on MySQL) are
+    #    filled with an UPDATE like the MySQL schema editor does.
+    _backfill(schema_editor, model, [
+        field for field in fields
+        if schema_editor.skip_default(field) and
+        field.default not in (None, NOT_PROVIDED)
+    ])
+
+
+def remove_fields(schema_editor, model, fields):
+    """
+    Remove the columns of ``fields`` from the table of ``model`` using a
+    single ALTER TABLE on PostgreSQL and MySQL and a single table rebuild
+    on SQLite.
+    """
+    connection = schema_editor.connection
+    method = _batch_method(connection, fields)
+    if method == 'remake':
+        schema_editor._remake_table(model, delete_fields=fields)
+        return
+    if method is None:
+        for field in fields:
+            schema_editor.remove_field(model, field)
+        return
+    qn = schema_editor.quote_name
+    table = qn(model._meta.db_table)
+    clauses = [
+        _alter_table_clause(
+            schema_editor.sql_delete_column, table,
+            column=qn(field.column))
+        for field in fields
+    ]
+    schema_editor.execute('ALTER TABLE %s %s' % (table, ', '.join(clauses)))
+    if connection.features.connection_persists_old_columns:
+        connection.close()
+
+
+class AddCompositeSubfields(Operation):
+    """
+    Add several subfields of a composite field to a model at once.
+
+    ``defaults`` maps field names to one-off values which are only used to
+    fill the new columns of existing rows, like AddField with
+    preserve_default=False.
+    """
+
+    def __init__(self, model_name, fields, defaults=None):
+        self.model_name = model_name
+        self.fields = fields
+        self.defaults = defaults or {}
+
+    @cached_property
+    def model_name_lower(self):
+        return self.model_name.lower()
+
+    def deconstruct(self):
+        kwargs = {
+            'model_name': self.model_name,
+            'fields': self.fields,
+        }
+        if self.defaults:
+            kwargs['defaults'] = self.defaults
+        return (
+            self.__class__.__name__,
+            [],
+            kwargs
+        )
+
+    def state_forwards(self, app_label, state):
+        model_state = state.models[app_label, self.model_name_lower]
+        model_state.fields.extend(self.fields)
+        state.reload_model(app_label, self.model_name_lower)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        to_model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, to_model):
+            from_model = from_state.apps.get_model(app_label, self.model_name)
+            fields = [to_model._meta.get_field(name) for name, _ in self.fields]
+            original_defaults = [field.default for field in fields]
+            for field in fields:
+                if field.name in self.defaults:
+                    field.default = self.defaults[field.name]
+            try:
+                add_fields(schema_editor, from_model, fields)
+            finally:
+                for field, default in zip(fields, original_defaults):
+                    field.default = default
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        from_model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, from_model):
+            remove_fields(schema_editor, from_model, [
+                from_model._meta.get_field(name) for name, _ in self.fields
+            ])
+
+    def describe(self):
+        return 'Add fields %s to %s' % (
+            ', '.join(name for name, _ in self.fields), self.model_name)
+
+    def references_model(self, name, app_label=None):
+        return name.lower() == self.model_name_lower
+
+    def references_field(self, model_name, name, app_label=None):
+        return self.references_model(model_name) and any(
+            name.lower() == field_name.lower() for field_name, _ in self.fields)
+
+
+class RemoveCompositeSubfields(Operation):
+    """
+    Remove several subfields of a composite field from a model at once.
+    """
+
+    def __init__(self, model_name, names):
+        self.model_name = model_name
+        self.names = names
+
+    @cached_property
+    def model_name_lower(self):
+        return self.model_name.lower()
+
+    def deconstruct(self):
+        kwargs = {
+            'model_name': self.model_name,
+            'names': self.names,
+        }
+        return (
+            self.__class__.__name__,
+            [],
+            kwargs
+        )
+
+    def state_forwards(self, app_label, state):
+        model_state = state.models[app_label, self.model_name_lower]
+        model_state.fields = [
+            (name, field) for name, field in model_state.fields
+            if name not in self.names
+        ]
+        state.reload_model(app_label, self.model_name_lower)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        from_model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, from_model):
+            remove_fields(schema_editor, from_model, [
+                from_model._meta.get_field(name) for name in self.names
+            ])
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        to_model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, to_model):
+            from_model = from_state.apps.get_model(app_label, self.model_name)
+            add_fields(schema_editor, from_model, [
+                to_model._meta.get_field(name) for name in self.names
+            ])
+
+    def describe(self):
+        return 'Remove fields %s from %s' % (
+            ', '.join(self.names), self.model_name)
+
+    def references_model(self, name, app_label=None):
+        return name.lower() == self.model_name_lower
+
+    def references_field(self, model_name, name, app_label=None):
+        return self.references_model(model_name) and any(
+            name.lower() == field_name.lower() for field_name in self.names)
@@ -0,0 +1,83 @@
+from .lookups import CompositeCol
+
+
+class KeysetPage(object):
+
+    def __init__(self, object_list, next_key, paginator):
+        self.object_list = object_list
+        self.next_key = next_key
+        self.paginator = paginator
+
+    def __repr__(self):
+        return '<KeysetPage after %r>' % (self.next_key,)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_key is not None
+
+
+class KeysetPaginator(object):
+    """
+    Paginate a queryset ordered by the subfields of a composite field.
+
+    Instead of an OFFSET every page is selected by comparing the
+    composite against the key of the last object of the previous page
+    (``coord__gt=next_key``), so fetching a deep page costs the same as
+    fetching the first one. The composite value must be unique within
+    the queryset, otherwise objects sharing a key with the last object
+    of a page are skipped.
+    """
+
+    def __init__(self, queryset, field_name, per_page):
+        self.queryset = queryset
+        self.field_name = field_name
+        self.per_page = int(per_page)
+        opts = queryset.model._meta
+        composite_field = opts.get_field(field_name)
+        # Only composites whose lookups compare all subfields can be used.
+        # The lookups of e.g. a LocalizedField compare a single column.
+        if not isinstance(composite_field.get_col(opts.db_table), CompositeCol):
+            raise TypeError(
+                '%s.%s does not support composite comparisons' % (
+                    opts.object_name, field_name))
+        self.ordering = [
+            composite_field.prefix + name for name in composite_field
+        ]
+
+    def page(self, after=None):
+        """
+        Return the page following the key ``after``, or the first page
+        if no key is given. The key can be anything accepted by the
+        composite ``gt`` lookup, usually the ``next_key`` of the previous
+        page.
+        """
+        queryset = self.queryset.order_by(*self.ordering)
+        if after is not None:
+            queryset = queryset.filter(**{
+                '%s__gt' % self.field_name: after,
+            })
+        object_list = list(queryset[:self.per_page + 1])
+        next_key = None
+        if len(object_list) > self.per_page:
+            del object_list[self.per_page:]
+            next_key = self.get_key(object_list[-1])
+        return KeysetPage(object_list, next_key, self)
+
+    def get_key(self, obj):
+        return tuple(getattr(obj, attname) for attname in self.ordering)
+
+    def __iter__(self):
+        page = self.page()
+        while True:
+            yield page
+            if not page.has_next():
+                break
+            page = self.page(after=page.next_key)
@@ -0,0 +1,56 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Manager, QuerySet
+from django.db.models.constants import LOOKUP_SEP
+
+from .base import CompositeField
+
+
+def expand_composite_names(model, names):
+    """
+    Replace the names of composite fields in ``names`` by the attnames of
+    their subfields. Names spanning relations (``place__coord``) are
+    followed to the related model. Anything which can't be resolved is
+    returned unchanged and left for Django to complain about.
+    """
+    expanded = []
+    for name in names:
+        parts = name.split(LOOKUP_SEP)
+        opts = model._meta
+        try:
+            for part in parts[:-1]:
+                related_model = opts.get_field(part).related_model
+                if related_model is None:
+                    raise FieldDoesNotExist
+                opts = related_model._meta
+            field = opts.get_field(parts[-1])
+        except FieldDoesNotExist:
+            field = None
+        if isinstance(field, CompositeField):
+            path = parts[:-1]
+            expanded.extend(
+                LOOKUP_SEP.join(path + [field.prefix + subfield_name])
+                for subfield_name in field)
+        else:
+            expanded.append(name)
+    return expanded
+
+
+class CompositeQuerySetMixin(object):
+
+    def defer(self, *fields):
+        if fields != (None,):
+            fields = expand_composite_names(self.model, fields)
+        return super(CompositeQuerySetMixin, self).defer(*fields)
+
+    def only(self, *fields):
+        if fields != (None,):
+            fields = expand_composite_names(self.model, fields)
+        return super(CompositeQuerySetMixin, self).only(*fields)
+
+
+class CompositeQuerySet(CompositeQuerySetMixin, QuerySet):
+    pass
+
+
+class CompositeManager(Manager.from_queryset(CompositeQuerySet)):
+    pass
@@ -1,9 +1,12 @@
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator
 from django.db import models
 from django.utils.encoding import python_2_unicode_compatible
 
 from composite_field import CompositeField
 from composite_field import LocalizedCharField
 from composite_field import ComplexField
+from composite_field.query import CompositeManager
 
 
 class CoordField(CompositeField):
@@ -15,6 +18,35 @@ class Place(models.Model):
     name = models.CharField(max_length=10)
     coord = CoordField()
 
+    objects = CompositeManager()
+
+
+class Visit(models.Model):
+    place = models.ForeignKey(Place, on_delete=models.CASCADE)
+    visitor = models.CharField(max_length=10)
+
+    objects = CompositeManager()
+
+
+class Holder(models.Model):
+    place = models.ForeignKey(Place, null=True, on_delete=models.SET_NULL)
+
+    objects = CompositeManager()
+
+
+class RangeField(CompositeField):
+    lower = models.IntegerField()
+    upper = models.IntegerField(validators=[MaxValueValidator(100)])
+
+
+def validate_range(value):
+    if value['lower'] > value['upper']:
+        raise ValidationError('lower must not exceed upper', code='range')
+
+
+class Booking(models.Model):
+    seats = RangeField(validators=[validate_range])
+
 
 class Direction(models.Model):
     source = CoordField()
@@ -31,6 +63,11 @@ class LocalizedFoo(models.Model):
         return self.name.current
 
 
+class LocalizedBar(models.Model):
+    foo = models.ForeignKey(LocalizedFoo, null=True, on_delete=models.SET_NULL)
+    name = LocalizedCharField(languages=('de', 'en'), max_length=50, null=True)
+
+
 class ComplexTuple(models.Model):
     x = ComplexField(blank=True, null=True)
     y = ComplexField(blank=False, null=False, verbose_name='Y')
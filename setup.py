@@ -48,7 +48,11 @@ setup(
     license='BSD',
     keywords='django composite field',
     url='http://bitbucket.org/bikeshedder/django-composite-field',
-    packages=['composite_field'],
+    packages=[
+        'composite_field',
+        'composite_field.management',
+        'composite_field.management.commands',
+    ],
     tests_require=['Django'],
     cmdclass={
         'test': DjangoTestCommand,